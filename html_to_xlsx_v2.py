@@ -7,43 +7,113 @@
 
 import sys
 import os
+import io
+import zipfile
+import codecs
 import re
 import platform
 import subprocess
 import traceback
 import threading
+import logging
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from charset_normalizer import from_bytes
+import lxml.etree
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from collections import defaultdict
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.dimensions import ColumnDimension
+from collections import defaultdict, Counter
 
 
 # --- Определяем режим работы ---
-IS_MACOS = platform.system() == 'Darwin'
+PLATFORM_SYSTEM = platform.system()
+IS_MACOS = PLATFORM_SYSTEM == 'Darwin'
+IS_WINDOWS = PLATFORM_SYSTEM == 'Windows'
 IS_FROZEN = getattr(sys, 'frozen', False)
 IS_WINDOWED = IS_FROZEN and IS_MACOS
 
+# Домашняя папка и Рабочий стол не меняются за время работы
+_HOME = os.path.expanduser("~")
+_DESKTOP = os.path.join(_HOME, "Desktop")
+
 # Файл лога для отладки (на рабочем столе)
 if IS_MACOS:
-    LOG_PATH = os.path.expanduser("~/Desktop/html_to_xlsx_log.txt")
+    LOG_PATH = os.path.join(_DESKTOP, "html_to_xlsx_log.txt")
 else:
     LOG_PATH = None
 
-
-def log(message):
-    """Пишет в лог-файл и в stdout (если доступен)."""
-    try:
-        print(message)
-    except Exception:
-        pass
-    if LOG_PATH:
-        try:
-            with open(LOG_PATH, 'a', encoding='utf-8') as f:
-                f.write(f"{datetime.now().strftime('%H:%M:%S')} {message}\n")
-        except Exception:
-            pass
+# Лог: stdout (если он есть) и файл на рабочем столе. Файл открывается один
+# раз при первой записи и остаётся открытым, а не на каждое сообщение.
+logger = logging.getLogger("html_to_xlsx")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+# Ошибки записи лога (нет консоли, нет прав) не должны мешать работе
+logging.raiseExceptions = False
+if sys.stdout is not None:
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+if LOG_PATH:
+    _log_file_handler = logging.FileHandler(LOG_PATH, encoding='utf-8', delay=True)
+    _log_file_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s',
+                                                     datefmt='%H:%M:%S'))
+    logger.addHandler(_log_file_handler)
+
+# Сколько байт с начала файла анализировать при определении кодировки
+CHARSET_SAMPLE_SIZE = 64 * 1024
+# Кодировки, в которых встречаются протоколы; другие не проверяем
+CHARSET_CANDIDATES = ['cp1251', 'utf_8', 'koi8_r', 'latin_1']
+
+# charset=... из <meta> (или заголовка Content-Type, сохранённого в файле)
+_META_CHARSET_RE = re.compile(rb'charset\s*=\s*["\']?([\w-]+)', re.I)
+# Кодировки из <meta>, которым верим сразу. Прочие объявления (latin-1,
+# windows-1252 — частое значение по умолчанию в редакторах) бывают ошибочными
+# и проверяются определением кодировки. Имена — как их отдаёт codecs.lookup.
+_TRUSTED_META_CHARSETS = ('cp1251', 'utf-8', 'koi8-r')
+# Первый байт вне ASCII: до него текст одинаков в любой из кодировок
+_NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+
+# Сколько мест команды выводится в таблицу (колонки 1..MAX_PLACES)
+MAX_PLACES = 20
+# Заголовок таблицы — общий для create_xlsx и create_xlsx_fast
+XLSX_HEADERS = ["Команда", "Кол-во участников"] + [str(i) for i in range(1, MAX_PLACES + 1)]
+
+# С какого числа файлов разбирать их в пуле процессов (иначе запуск дороже)
+PARALLEL_MIN_FILES = 4
+
+# Название команды вида "12. Команда" — сортируем по номеру, затем по имени
+_SORT_KEY_RE = re.compile(r'^(\d+)\.\s*(.+)$')
+
+# Отметки сошедших участников: н/ф, в/к, дисквалификация, снят
+_STATUS_RE = re.compile(r'н/ф|в/к|дск|снят|снт|дисквал')
+# Так выглядит отметка из файла, когда-то сохранённого в неверной кодировке
+_BROKEN_STATUS = 'пїЅ'
+# Отметка «сошёл» и номера мест повторяются тысячи раз — храним по одной копии
+_PLACE_DNF = sys.intern('Сошел')
+
+# XPath-выражения компилируются один раз, а не при каждом вызове .xpath()
+_SILVER_ROWS = lxml.etree.XPath('.//tr[@bgcolor="silver"]')
+_TABLE_ROWS = lxml.etree.XPath('./tr | ./tbody/tr')
+_ROW_CELLS = lxml.etree.XPath('./td')
+_TABLE_START_RE = re.compile(rb'<table', re.I)
+
+# Стили xlsx создаются один раз и переиспользуются всеми ячейками
+_HEADER_FONT = Font(bold=True, size=11)
+_HEADER_FILL = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
+_HEADER_ALIGN = Alignment(horizontal='center', vertical='center', wrap_text=True)
+_CENTER_ALIGN = Alignment(horizontal='center', vertical='center')
+_LEFT_ALIGN = Alignment(horizontal='left', vertical='center')
+_THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
 
 
 def notify(title, message):
@@ -58,7 +128,7 @@ def notify(title, message):
             ], timeout=5)
         except Exception:
             pass
-    log(f"[{title}] {message}")
+    logger.info(f"[{title}] {message}")
 
 
 def notify_error(message):
@@ -91,220 +161,514 @@ def get_output_folder(filepaths):
         os.remove(test_file)
         return output_folder, timestamp
     except (OSError, PermissionError):
-        log(f"Нет прав записи в {first_file_dir}, пробуем Рабочий стол")
+        logger.info(f"Нет прав записи в {first_file_dir}, пробуем Рабочий стол")
     
     # Попытка 2: Рабочий стол
-    if IS_MACOS:
-        desktop = os.path.expanduser("~/Desktop")
-    else:
-        desktop = os.path.join(os.path.expanduser("~"), "Desktop")
-    
-    output_folder = os.path.join(desktop, folder_name)
+    output_folder = os.path.join(_DESKTOP, folder_name)
     try:
         os.makedirs(output_folder, exist_ok=True)
         return output_folder, timestamp
     except (OSError, PermissionError):
-        log(f"Нет прав записи на Рабочий стол")
+        logger.info(f"Нет прав записи на Рабочий стол")
     
     # Попытка 3: домашняя папка
-    output_folder = os.path.join(os.path.expanduser("~"), folder_name)
+    output_folder = os.path.join(_HOME, folder_name)
     os.makedirs(output_folder, exist_ok=True)
     return output_folder, timestamp
 
 
-def parse_html_file(filepath):
-    """Парсит HTML файл и возвращает список (команда, место)."""
-    results = []
+def _cell_text(cell):
+    """Текст ячейки lxml: обрезанные текстовые узлы, склеенные без пробелов."""
+    return ''.join(text.strip() for text in cell.itertext())
+
+
+def _iter_data_rows_lxml(raw_data, encoding):
+    """Возвращает тексты ячеек строки участников каждой таблицы (lxml).
     
-    with open(filepath, 'rb') as f:
-        raw_data = f.read()
+    Таблицы разбираются потоково: в памяти держится только текущая.
+    """
+    source = io.BytesIO(raw_data)
+    # Всё до первой <table> (head, стили, шапка страницы) разбирать незачем.
+    # Искать тег по байтам можно только в ASCII-совместимой кодировке.
+    if '<'.encode(encoding) == b'<':
+        match = _TABLE_START_RE.search(raw_data)
+        if match is None:
+            return
+        # Если <table> найдена внутри комментария или <script> (например,
+        # закомментированная старая таблица), разбираем файл с начала
+        head = raw_data[:match.start()].lower()
+        if (head.rfind(b'<!--') <= head.rfind(b'-->')
+                and head.rfind(b'<script') <= head.rfind(b'</script')):
+            source.seek(match.start())
+    
+    tables = lxml.etree.iterparse(source, html=True, tag='table', encoding=encoding)
+    for _, table in tables:
+        # Нужны только таблицы с серой строкой заголовка
+        if _SILVER_ROWS(table):
+            # Таблицы результатов не вложены: берём только собственные строки
+            for row in _TABLE_ROWS(table):
+                cells = _ROW_CELLS(row)
+                if len(cells) >= 10 and _cell_text(cells[0]) == '1':
+                    yield [_cell_text(cell) for cell in cells]
+                    break
+        
+        # Разобранная таблица и всё, что было до неё, больше не нужны
+        table.clear()
+        while table.getprevious() is not None:
+            del table.getparent()[0]
+
+
+class _ResultTableParser(HTMLParser):
+    """Разбор таблиц результатов без построения дерева (запасной путь).
+    
+    Для каждой таблицы с серой строкой заголовка в data_rows попадают
+    тексты ячеек первой строки с участником №1. Незакрытые <td> и <tr>
+    закрываются следующим тегом, как это делают браузеры.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.data_rows = []
+        # Стек открытых таблиц: [есть серая строка, строка данных, ячейки строки]
+        self._tables = []
+        self._cell = None
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            self._close_cell()
+            self._tables.append([False, None, None])
+        elif not self._tables:
+            return
+        elif tag == 'tr':
+            self._close_row()
+            table = self._tables[-1]
+            table[2] = []
+            if ('bgcolor', 'silver') in attrs:
+                table[0] = True
+        elif tag == 'td':
+            self._close_cell()
+            if self._tables[-1][2] is not None:
+                self._cell = []
+    
+    def handle_endtag(self, tag):
+        if not self._tables:
+            return
+        if tag == 'td':
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+        elif tag == 'table':
+            self._close_row()
+            has_silver, data_row, _ = self._tables.pop()
+            if has_silver and data_row is not None:
+                self.data_rows.append(data_row)
     
-    header = raw_data[:1000].decode('ascii', errors='ignore').lower()
+    def handle_data(self, data):
+        if self._cell is not None:
+            text = data.strip()
+            if text:
+                self._cell.append(text)
     
-    encoding = None
-    if 'charset=windows-1251' in header or 'charset=cp1251' in header:
-        encoding = 'cp1251'
-    elif 'charset=utf-8' in header:
-        encoding = 'utf-8'
-    elif 'charset=koi8-r' in header:
-        encoding = 'koi8-r'
+    def _close_cell(self):
+        if self._cell is not None:
+            self._tables[-1][2].append(''.join(self._cell))
+            self._cell = None
     
-    encodings_to_try = []
-    if encoding:
-        encodings_to_try.append(encoding)
-    encodings_to_try.extend(['cp1251', 'utf-8', 'koi8-r', 'latin-1'])
+    def _close_row(self):
+        self._close_cell()
+        table = self._tables[-1]
+        cells = table[2]
+        table[2] = None
+        if (table[1] is None and cells is not None
+                and len(cells) >= 10 and cells[0] == '1'):
+            table[1] = cells
+
+
+def _iter_data_rows_html(content):
+    """То же, что _iter_data_rows_lxml, но через html.parser (запасной путь)."""
+    parser = _ResultTableParser()
+    parser.feed(content)
+    parser.close()
+    return parser.data_rows
+
+
+def _charset_sample(raw_data):
+    """Кусок файла для определения кодировки (пустой, если файл весь в ASCII).
     
-    content = None
-    for enc in encodings_to_try:
+    Берётся от первого байта вне ASCII: большие <style>/<script> в начале
+    страницы ничего не говорят о кодировке. Оборванный на границе куска
+    символ UTF-8 отбрасывается, иначе UTF-8 не распознаётся.
+    """
+    match = _NON_ASCII_RE.search(raw_data)
+    if not match:
+        return b''
+    start = match.start()
+    sample = raw_data[start:start + CHARSET_SAMPLE_SIZE]
+    if len(sample) < CHARSET_SAMPLE_SIZE:
+        return sample
+    
+    # Ищем начальный байт последнего символа среди 4 последних байтов
+    for back in range(1, 5):
+        byte = sample[-back]
+        if byte < 0x80:
+            break
+        if byte >= 0xC0:
+            length = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            if length > back:
+                sample = sample[:-back]
+            break
+    return sample
+
+
+def _detect_encoding(raw_data):
+    """Определяет кодировку HTML файла (имя кодека Python)."""
+    # BOM однозначно задаёт кодировку — дальше можно не смотреть
+    if raw_data.startswith(codecs.BOM_UTF8):
+        return 'utf-8'
+    if raw_data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    
+    sample = _charset_sample(raw_data)
+    
+    # <meta> иногда стоит после больших комментариев, поэтому смотрим 2 КБ
+    match = _META_CHARSET_RE.search(raw_data, 0, 2048)
+    if match:
         try:
-            content = raw_data.decode(enc)
-            if content.count('\ufffd') < 10:
-                break
-        except (UnicodeDecodeError, LookupError):
-            continue
+            # codecs приводит синонимы к одному имени: windows-1251 -> cp1251
+            declared = codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            declared = None
+        # utf-16 в <meta> без BOM по стандарту HTML читается как utf-8
+        if declared in ('utf-16', 'utf-16-le', 'utf-16-be'):
+            declared = 'utf-8'
+        if declared in _TRUSTED_META_CHARSETS:
+            # meta бывает ошибочным (cp1251 под видом utf-8), а libxml2 такие
+            # байты молча заменяет на \ufffd — проверяем кусок сами
+            try:
+                sample.decode(declared)
+                return declared
+            except UnicodeDecodeError:
+                pass
     
-    if content is None:
-        log(f"Ошибка: не удалось прочитать файл {filepath}")
-        return results
+    if not sample:
+        return 'cp1251'
     
-    soup = BeautifulSoup(content, 'html.parser')
-    tables = soup.find_all('table')
+    # Определяем кодировку по куску файла, а не перебором всего содержимого
+    best = from_bytes(sample, cp_isolation=CHARSET_CANDIDATES).best()
+    if best is not None and best.encoding != 'ascii':
+        return codecs.lookup(best.encoding).name
     
-    for table in tables:
-        header_row = table.find('tr', bgcolor='silver')
-        if not header_row:
-            continue
-        
-        rows = table.find_all('tr')
-        data_row = None
-        for row in rows:
-            cells = row.find_all('td')
-            if cells and len(cells) >= 10:
-                first_cell = cells[0].get_text(strip=True)
-                if first_cell == '1':
-                    data_row = row
-                    break
-        
-        if not data_row:
-            continue
-        
-        cells = data_row.find_all('td')
-        
-        step = 10
-        for i in range(8, min(15, len(cells))):
-            cell_text = cells[i].get_text(strip=True)
-            if cell_text == '2':
-                step = i
-                break
+    # charset_normalizer не решил: корректный UTF-8 случайно почти не
+    # получается, поэтому проверяем его, а иначе считаем файл cp1251
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'cp1251'
+    return 'utf-8'
+
+
+def _detect_step(texts, hint):
+    """Число ячеек на участника — позиция ячейки с номером '2' (от 8 до 14).
+    
+    Сначала проверяются hint (шаг предыдущей таблицы) и обычный шаг 10,
+    и только затем перебирается весь диапазон.
+    """
+    for candidate in (hint, 10):
+        if (candidate < len(texts) and texts[candidate] == '2'
+                and '2' not in texts[8:candidate]):
+            return candidate
+    
+    for i in range(8, min(15, len(texts))):
+        if texts[i] == '2':
+            return i
+    return 10
+
+
+def parse_html_file(filepath):
+    """Парсит HTML файл и по очереди выдаёт пары (команда, место)."""
+    with open(filepath, 'rb') as f:
+        raw_data = f.read()
+    
+    encoding = _detect_encoding(raw_data)
+    
+    try:
+        data_rows = list(_iter_data_rows_lxml(raw_data, encoding))
+    except (lxml.etree.LxmlError, LookupError) as e:
+        logger.info(f"lxml не смог разобрать {filepath}: {e}, используем html.parser")
+        content = raw_data.decode(encoding, errors='replace')
+        data_rows = _iter_data_rows_html(content)
+    
+    step = 10
+    for texts in data_rows:
+        # Таблицы одного файла обычно свёрстаны одинаково
+        step = _detect_step(texts, step)
         
-        i = 0
-        while i < len(cells):
-            remaining_cells = len(cells) - i
+        for start in range(0, len(texts), step):
+            participant_texts = texts[start:start + step]
             
-            if remaining_cells < 4:
+            # Хвост короче 4 ячеек может быть только последним блоком
+            if len(participant_texts) < 4:
                 break
             
-            current_block_size = min(step, remaining_cells)
-            participant_cells = cells[i:i+current_block_size]
-            
-            first = participant_cells[0].get_text(strip=True)
-            if not first.isdigit():
-                i += step
+            if not participant_texts[0].isdigit():
                 continue
             
-            team = participant_cells[3].get_text(strip=True)
+            team = participant_texts[3]
             
             place = None
-            for j in range(len(participant_cells) - 1, 3, -1):
-                cell_text = participant_cells[j].get_text(strip=True)
+            for j in range(len(participant_texts) - 1, 3, -1):
+                cell_text = participant_texts[j]
                 if cell_text and ':' not in cell_text:
-                    if cell_text.isdigit() and len(cell_text) == 4:
-                        year = int(cell_text)
-                        if 1900 <= year <= 2100:
-                            continue
-                    
                     if cell_text.isdigit():
-                        place = cell_text
+                        # Четырёхзначное число из диапазона лет — год рождения.
+                        # Строки одной длины из цифр сравниваются как числа.
+                        if len(cell_text) == 4 and '1900' <= cell_text <= '2100':
+                            continue
+                        place = sys.intern(cell_text)
                         break
-                    cell_lower = cell_text.lower()
-                    if any(x in cell_lower for x in ['н/ф', 'в/к', 'дск', 'снят', 'снт', 'дисквал']):
-                        place = 'Сошел'
+                    if _STATUS_RE.search(cell_text.lower()):
+                        place = _PLACE_DNF
                         break
-                    if 'пїЅ' in cell_text:
-                        place = 'Сошел'
+                    if _BROKEN_STATUS in cell_text:
+                        place = _PLACE_DNF
                         break
             
             if place is None and team:
-                place = 'Сошел'
+                place = _PLACE_DNF
             
             if team and place:
-                results.append((team, place))
-            
-            i += step
-    
-    return results
+                yield team, place
 
 
 def extract_sort_key(team_name):
-    match = re.match(r'^(\d+)\.\s*(.+)$', team_name)
+    match = _SORT_KEY_RE.match(team_name)
     if match:
         return (int(match.group(1)), match.group(2).lower())
     return (float('inf'), team_name.lower())
 
 
-def process_files(filepaths):
-    """Обрабатывает все файлы и группирует результаты по командам."""
-    teams_data = defaultdict(list)
+def _parse_file_list(filepath):
+    """Разбирает файл целиком (список можно передать из пула процессов).
     
-    for filepath in filepaths:
-        if not os.path.exists(filepath):
-            log(f"Файл не найден: {filepath}")
+    Возвращает None, если файл не удалось открыть.
+    """
+    # Имя файла — до разбора, чтобы ошибки и сообщения парсера шли после него
+    logger.info(f"Обработка: {os.path.basename(filepath)}")
+    try:
+        return list(parse_html_file(filepath))
+    except FileNotFoundError:
+        logger.info(f"Файл не найден: {filepath}")
+    except OSError as e:
+        logger.info(f"Не удалось прочитать файл {filepath}: {e}")
+    return None
+
+
+def _merge_results(teams_data, teams_total, all_results):
+    """Добавляет места из каждого разобранного файла к результатам команд."""
+    for results in all_results:
+        if results is None:
             continue
         
-        log(f"Обработка: {os.path.basename(filepath)}")
-        results = parse_html_file(filepath)
-        
         for team, place in results:
-            teams_data[team].append(place)
+            teams_total[team] += 1
+            # В таблицу попадают только первые MAX_PLACES мест, остальные не храним
+            places = teams_data[team]
+            if len(places) < MAX_PLACES:
+                # Из пула процессов строки приходят новыми копиями — интернируем снова
+                places.append(sys.intern(place))
+
+
+def process_files(filepaths):
+    """Обрабатывает все файлы и группирует результаты по командам.
     
-    return teams_data
+    Возвращает (места команд, число участников каждой команды).
+    """
+    teams_data = defaultdict(list)
+    teams_total = Counter()
+    
+    # Существование файлов не проверяем заранее: ошибку даст само открытие
+    if len(filepaths) < PARALLEL_MIN_FILES:
+        _merge_results(teams_data, teams_total, map(_parse_file_list, filepaths))
+    else:
+        # Файлы независимы — разбираем их параллельно, порядок сохраняет map.
+        # Процессов больше, чем файлов, не запускаем.
+        workers = min(len(filepaths), os.cpu_count() or 1)
+        # На больших пачках файлы отдаются процессам порциями, а не по одному
+        chunksize = max(1, len(filepaths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            all_results = executor.map(_parse_file_list, filepaths, chunksize=chunksize)
+            _merge_results(teams_data, teams_total, all_results)
+    
+    return teams_data, teams_total
+
+
+def _add_named_styles(wb):
+    """Регистрирует в книге стили ячеек: одно присваивание вместо нескольких."""
+    wb.add_named_style(NamedStyle(name='header', font=_HEADER_FONT, fill=_HEADER_FILL,
+                                  alignment=_HEADER_ALIGN, border=_THIN_BORDER))
+    wb.add_named_style(NamedStyle(name='data_center', font=DEFAULT_FONT,
+                                  alignment=_CENTER_ALIGN, border=_THIN_BORDER))
+    wb.add_named_style(NamedStyle(name='data_left', font=DEFAULT_FONT,
+                                  alignment=_LEFT_ALIGN, border=_THIN_BORDER))
 
 
-def create_xlsx(teams_data, output_path):
+def _styled_cell(ws, value, style):
+    """Ячейка с именованным стилем, зарегистрированным в _add_named_styles."""
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def create_xlsx(teams_data, teams_total, output_path):
     """Создаёт xlsx файл с результатами."""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Результаты"
-    
-    header_font = Font(bold=True, size=11)
-    header_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    cell_alignment = Alignment(horizontal='center', vertical='center')
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    headers = ["Команда", "Кол-во участников"] + [str(i) for i in range(1, 21)]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
+    # write-only режим: строки пишутся потоком, без словаря всех ячеек
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Результаты")
+    _add_named_styles(wb)
+    
+    # Ширины колонок нужно задать до первой строки
+    ws.column_dimensions['A'].width = 30
+    ws.column_dimensions['B'].width = 15
+    # Колонки мест (C и дальше) задаются одним диапазоном min..max
+    ws.column_dimensions['C'] = ColumnDimension(ws, index='C', min=3,
+                                                max=2 + MAX_PLACES, width=6)
+    
+    ws.append([_styled_cell(ws, header, 'header') for header in XLSX_HEADERS])
     
     sorted_teams = sorted(teams_data.keys(), key=extract_sort_key)
     
-    for row_idx, team in enumerate(sorted_teams, 2):
+    for team in sorted_teams:
         places = teams_data[team]
-        
-        cell = ws.cell(row=row_idx, column=1, value=team)
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal='left', vertical='center')
-        
-        cell = ws.cell(row=row_idx, column=2, value=len(places))
-        cell.border = thin_border
-        cell.alignment = cell_alignment
-        
-        for place_idx, place in enumerate(places[:20]):
-            cell = ws.cell(row=row_idx, column=3 + place_idx, value=place)
-            cell.border = thin_border
-            cell.alignment = cell_alignment
-        
-        for empty_idx in range(len(places), 20):
-            cell = ws.cell(row=row_idx, column=3 + empty_idx, value="")
-            cell.border = thin_border
-    
-    ws.column_dimensions['A'].width = 30
-    ws.column_dimensions['B'].width = 15
-    for col_letter in ['C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 
-                       'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V']:
-        ws.column_dimensions[col_letter].width = 6
+        # Строка собирается целиком и добавляется одним вызовом append
+        ws.append([
+            _styled_cell(ws, team, 'data_left'),
+            _styled_cell(ws, teams_total[team], 'data_center'),
+            *[_styled_cell(ws, place, 'data_center') for place in places],
+        ])
     
     wb.save(output_path)
-    log(f"Файл сохранён: {output_path}")
+    logger.info(f"Файл сохранён: {output_path}")
+
+
+# --- Быстрая запись xlsx (--fast): XML листа пишется напрямую через lxml ---
+_XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<workbook xmlns="{_XLSX_NS}" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Результаты" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Те же стили, что и в create_xlsx: 1 — заголовок, 2 — по центру, 3 — по левому краю
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<styleSheet xmlns="{_XLSX_NS}">'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font>'
+    '<font><b/><sz val="11"/></font>'
+    '</fonts>'
+    '<fills count="3">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="00D9E1F2"/><bgColor rgb="00D9E1F2"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="2">'
+    '<border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>'
+    '</borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="1" xfId="0" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center"/></xf>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="left" vertical="center"/></xf>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+_FAST_HEADER_STYLE = '1'
+_FAST_CENTER_STYLE = '2'
+_FAST_LEFT_STYLE = '3'
+
+
+def _fast_cell(ref, value, style):
+    """Элемент <c> листа: числа пишутся как числа, остальное — строкой."""
+    cell = lxml.etree.Element('c', r=ref, s=style)
+    if isinstance(value, int):
+        lxml.etree.SubElement(cell, 'v').text = str(value)
+    else:
+        cell.set('t', 'inlineStr')
+        inline = lxml.etree.SubElement(cell, 'is')
+        lxml.etree.SubElement(inline, 't').text = value
+    return cell
+
+
+def create_xlsx_fast(teams_data, teams_total, output_path):
+    """То же, что create_xlsx, но без openpyxl: XML листа пишется потоком."""
+    letters = [get_column_letter(col) for col in range(1, 3 + MAX_PLACES)]
+    sorted_teams = sorted(teams_data.keys(), key=extract_sort_key)
+    
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK)
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        zf.writestr('xl/styles.xml', _XLSX_STYLES)
+        
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as sheet, \
+                lxml.etree.xmlfile(sheet, encoding='utf-8') as xf:
+            xf.write_declaration(standalone=True)
+            with xf.element('worksheet', xmlns=_XLSX_NS):
+                with xf.element('cols'):
+                    xf.write(lxml.etree.Element('col', min='1', max='1', width='30', customWidth='1'))
+                    xf.write(lxml.etree.Element('col', min='2', max='2', width='15', customWidth='1'))
+                    xf.write(lxml.etree.Element('col', min='3', max=str(2 + MAX_PLACES),
+                                                width='6', customWidth='1'))
+                
+                with xf.element('sheetData'):
+                    with xf.element('row', r='1'):
+                        for letter, header in zip(letters, XLSX_HEADERS):
+                            xf.write(_fast_cell(f'{letter}1', header, _FAST_HEADER_STYLE))
+                    
+                    for row_idx, team in enumerate(sorted_teams, 2):
+                        with xf.element('row', r=str(row_idx)):
+                            xf.write(_fast_cell(f'A{row_idx}', team, _FAST_LEFT_STYLE))
+                            xf.write(_fast_cell(f'B{row_idx}', teams_total[team], _FAST_CENTER_STYLE))
+                            for letter, place in zip(letters[2:], teams_data[team]):
+                                xf.write(_fast_cell(f'{letter}{row_idx}', place, _FAST_CENTER_STYLE))
+    
+    logger.info(f"Файл сохранён: {output_path}")
 
 
 def open_folder(path):
@@ -312,53 +676,61 @@ def open_folder(path):
     try:
         if IS_MACOS:
             subprocess.run(['open', path], timeout=5)
-        elif platform.system() == 'Windows':
+        elif IS_WINDOWS:
             os.startfile(path)
     except Exception:
         pass
 
 
-def run_processing(filepaths):
-    """Основная логика обработки файлов."""
-    log(f"Получено файлов для обработки: {len(filepaths)}")
+def run_processing(filepaths, fast=False):
+    """Основная логика обработки файлов.
+    
+    fast=True — записать xlsx через create_xlsx_fast вместо openpyxl.
+    """
+    logger.info(f"Получено файлов для обработки: {len(filepaths)}")
     for fp in filepaths:
-        log(f"  -> {fp}")
+        logger.info(f"  -> {fp}")
     
-    teams_data = process_files(filepaths)
+    teams_data, teams_total = process_files(filepaths)
     
     if not teams_data:
         notify_error("Не удалось извлечь данные из файлов!")
         return
     
-    total_participants = sum(len(places) for places in teams_data.values())
-    log(f"Найдено команд: {len(teams_data)}, участников: {total_participants}")
+    total_participants = sum(teams_total.values())
+    logger.info(f"Найдено команд: {len(teams_data)}, участников: {total_participants}")
     
     output_folder, timestamp = get_output_folder(filepaths)
     output_filename = f"Результаты по командам {timestamp}.xlsx"
     output_path = os.path.join(output_folder, output_filename)
     
-    create_xlsx(teams_data, output_path)
+    writer = create_xlsx_fast if fast else create_xlsx
+    writer(teams_data, teams_total, output_path)
     
     notify("html_to_xlsx — Готово!",
            f"Команд: {len(teams_data)}, участников: {total_participants}")
     
     open_folder(output_folder)
-    log(f"Результаты сохранены в: {output_folder}")
+    logger.info(f"Результаты сохранены в: {output_folder}")
 
 
 def main_cli():
     """Запуск из командной строки (Windows или терминал macOS)."""
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    fast = '--fast' in args
+    filepaths = [arg for arg in args if arg != '--fast']
+    
+    if not filepaths:
         print("=" * 50)
         print("Обработчик HTML таблиц результатов соревнований")
         print("=" * 50)
         print("\nИспользование: перетащите HTML файлы на exe")
         print("или запустите: python html_to_xlsx_v2.py файл1.html файл2.html ...")
+        print("Ключ --fast: быстрая запись xlsx без openpyxl (для больших таблиц)")
         wait_before_exit()
         return
     
-    filepaths = sys.argv[1:]
-    run_processing(filepaths)
+    run_processing(filepaths, fast=fast)
     wait_before_exit()
 
 
@@ -375,21 +747,21 @@ def main_macos_app():
             _processed = False
             
             def applicationWillFinishLaunching_(self, notification):
-                log("AppDelegate: applicationWillFinishLaunching")
+                logger.info("AppDelegate: applicationWillFinishLaunching")
             
             def applicationDidFinishLaunching_(self, notification):
-                log("AppDelegate: applicationDidFinishLaunching")
+                logger.info("AppDelegate: applicationDidFinishLaunching")
                 # Даём время на получение файлов через Apple Events
                 threading.Timer(1.0, self.checkAndProcess).start()
             
             def application_openFiles_(self, app, filenames):
                 """Вызывается macOS при drag & drop файлов на .app."""
-                log(f"AppDelegate: получены файлы через openFiles: {list(filenames)}")
+                logger.info(f"AppDelegate: получены файлы через openFiles: {list(filenames)}")
                 self._files.extend(filenames)
             
             def application_openFile_(self, app, filename):
                 """Вызывается macOS при открытии одного файла."""
-                log(f"AppDelegate: получен файл через openFile: {filename}")
+                logger.info(f"AppDelegate: получен файл через openFile: {filename}")
                 self._files.append(filename)
                 return True
             
@@ -409,18 +781,18 @@ def main_macos_app():
                     ]
                     if argv_files:
                         filepaths = argv_files
-                        log(f"Файлы из sys.argv: {filepaths}")
+                        logger.info(f"Файлы из sys.argv: {filepaths}")
                 
                 if filepaths:
                     try:
                         run_processing(filepaths)
                     except Exception as e:
-                        log(f"Ошибка обработки: {e}")
-                        log(traceback.format_exc())
+                        logger.error(f"Ошибка обработки: {e}")
+                        logger.error(traceback.format_exc())
                         notify_error(str(e))
                 else:
                     notify("html_to_xlsx", "Перетащите HTML файлы на иконку приложения")
-                    log("Нет входных файлов")
+                    logger.info("Нет входных файлов")
                 
                 # Завершаем приложение
                 NSApp.terminate_(None)
@@ -429,27 +801,33 @@ def main_macos_app():
         delegate = AppDelegate.alloc().init()
         app.setDelegate_(delegate)
         
-        log("Запуск NSApplication run loop...")
+        logger.info("Запуск NSApplication run loop...")
         app.run()
         
     except ImportError as e:
-        log(f"PyObjC не доступен: {e}")
-        log("Fallback на CLI режим")
+        logger.info(f"PyObjC не доступен: {e}")
+        logger.info("Fallback на CLI режим")
         main_cli()
 
 
 def main():
     """Точка входа."""
     try:
-        # Очищаем лог при каждом запуске
+        # Очищаем лог при каждом запуске. Этот же файл дальше пишет логгер:
+        # он открывается один раз, а закрывает его logging при выходе.
+        # Режим 'a', а не 'w': процессы пула дописывают в этот же файл, и
+        # запись с собственной позиции затирала бы их строки.
         if LOG_PATH:
             try:
-                with open(LOG_PATH, 'w', encoding='utf-8') as f:
-                    f.write(f"=== html_to_xlsx запуск {datetime.now()} ===\n")
-                    f.write(f"sys.argv: {sys.argv}\n")
-                    f.write(f"platform: {platform.system()} {platform.machine()}\n")
-                    f.write(f"IS_WINDOWED: {IS_WINDOWED}\n")
-                    f.write(f"IS_FROZEN: {IS_FROZEN}\n\n")
+                f = open(LOG_PATH, 'a', encoding='utf-8')
+                f.truncate(0)
+                f.write(f"=== html_to_xlsx запуск {datetime.now()} ===\n")
+                f.write(f"sys.argv: {sys.argv}\n")
+                f.write(f"platform: {PLATFORM_SYSTEM} {platform.machine()}\n")
+                f.write(f"IS_WINDOWED: {IS_WINDOWED}\n")
+                f.write(f"IS_FROZEN: {IS_FROZEN}\n\n")
+                f.flush()
+                _log_file_handler.setStream(f)
             except Exception:
                 pass
         
@@ -462,11 +840,13 @@ def main():
         
     except Exception as e:
         error_msg = f"Критическая ошибка: {str(e)}"
-        log(error_msg)
-        log(traceback.format_exc())
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
         notify_error(str(e))
         wait_before_exit()
 
 
 if __name__ == "__main__":
+    # Нужно для пула процессов в собранных PyInstaller exe/.app
+    multiprocessing.freeze_support()
     main()